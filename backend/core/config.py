@@ -1,6 +1,6 @@
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, List, Optional
 
 # Load environment variables from .env file
 load_dotenv()
@@ -21,6 +21,40 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     
+    # Usernames allowed to read process-wide operational metrics, as JSON, e.g. ["ops"]
+    METRICS_ADMIN_USERS: List[str] = []
+    
+    # Exports only include records older than this lag so late-committing or
+    # not-yet-replicated writes aren't skipped by the next incremental run
+    EXPORT_SAFETY_LAG_SECONDS: int = 300
+    
+    # Model tiers used by the per-stage model router
+    LLM_MODEL_FAST: str = "gemini-2.0-flash-lite"
+    LLM_MODEL_STANDARD: str = "gemini-2.0-flash"
+    LLM_MODEL_ADVANCED: str = "gemini-2.5-pro"
+    
+    # Document size thresholds (in PDF pages) for routing rules
+    SMALL_DOCUMENT_MAX_PAGES: int = 20
+    LARGE_DOCUMENT_MIN_PAGES: int = 100
+    
+    # Per-stage overrides as JSON, e.g. {"risk_assessment": "advanced"}; values are tiers or model names
+    MODEL_ROUTING_OVERRIDES: Dict[str, str] = {}
+    
+    # Outbound rate limiting for Gemini and Serper ("mongo" shares buckets across workers, "memory" is per process)
+    RATE_LIMIT_BACKEND: str = "mongo"
+    RATE_LIMIT_FALLBACK_COOLDOWN_SECONDS: int = 30
+    # Share of each bucket's burst capacity that batch jobs can't use, kept for interactive jobs
+    INTERACTIVE_RESERVED_FRACTION: float = 0.2
+    GEMINI_REQUESTS_PER_MINUTE: int = 1000
+    GEMINI_BURST: int = 50
+    SERPER_REQUESTS_PER_MINUTE: int = 300
+    SERPER_BURST: int = 20
+    
+    # Retry policy for quota (429) and transient server errors on outbound calls
+    OUTBOUND_MAX_RETRIES: int = 5
+    OUTBOUND_BACKOFF_BASE_SECONDS: float = 1.0
+    OUTBOUND_BACKOFF_MAX_SECONDS: float = 60.0
+    
     # Optional API key for compatibility
     OPENAI_API_KEY: Optional[str] = None
     
@@ -0,0 +1,373 @@
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+from pymongo import MongoClient, ReturnDocument
+from core.config import settings
+
+# Job priorities. Across workers, batch callers can't draw the bucket below a reserve
+# kept for interactive callers; within a process, queued callers are also served
+# in rank order (lower first).
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITY_RANKS = {INTERACTIVE: 0, BATCH: 1}
+
+# Priority of the job making outbound calls, set per analysis and inherited by worker threads
+outbound_priority: ContextVar[str] = ContextVar("outbound_priority", default=INTERACTIVE)
+
+# Window used to report recent utilization against the configured rate
+UTILIZATION_WINDOW_SECONDS = 60
+
+# Keep shared-bucket round trips short so a MongoDB outage degrades to the local bucket quickly
+MONGO_TIMEOUT_MS = 500
+
+# HTTP/gRPC status codes treated as transient and retried with backoff
+TRANSIENT_STATUS_CODES = (500, 503, 504)
+
+class RateLimitError(Exception):
+    """Raised when a provider signals throttling without raising an error itself."""
+
+def _status_code(error: BaseException) -> Optional[int]:
+    """Extracts an HTTP/gRPC status code from SDK or HTTP client errors."""
+    for code in (getattr(error, "code", None), getattr(error, "status_code", None),
+                 getattr(getattr(error, "response", None), "status_code", None)):
+        if isinstance(code, int):
+            return code
+    return None
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Detects quota/throttling errors from the Gemini SDK or HTTP-based tools."""
+    if isinstance(error, RateLimitError) or _status_code(error) == 429:
+        return True
+    message = f"{type(error).__name__} {error}".lower()
+    return any(marker in message for marker in ("resourceexhausted", "resource exhausted", "quota", "too many requests"))
+
+def reserved_tokens(capacity: float) -> float:
+    """Tokens batch callers must leave in a bucket; always leaves them at least one usable token."""
+    return max(0.0, min(capacity - 1, capacity * settings.INTERACTIVE_RESERVED_FRACTION))
+
+def grant_threshold(capacity: float, priority: str) -> float:
+    """Minimum token level at which a caller of the given priority may take a token."""
+    return 1.0 if priority == INTERACTIVE else 1.0 + reserved_tokens(capacity)
+
+def is_transient_error(error: BaseException) -> bool:
+    """Detects server-side errors that are worth retrying."""
+    return _status_code(error) in TRANSIENT_STATUS_CODES
+
+class LocalTokenBucket:
+    """In-process token bucket, used when no shared backend is configured."""
+
+    def __init__(self, requests_per_minute: int, burst: int):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, priority: str = INTERACTIVE) -> float:
+        """Takes a token if available to this priority and returns 0, otherwise returns seconds until one is."""
+        threshold = grant_threshold(self.capacity, priority)
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.refilled_at) * self.rate)
+            self.refilled_at = now
+            if self.tokens >= threshold:
+                self.tokens -= 1
+                return 0.0
+            return (threshold - self.tokens) / self.rate
+
+    def recent_calls(self) -> Optional[int]:
+        """Local buckets don't track calls; the governor's own counters are used instead."""
+        return None
+
+class MongoTokenBucket:
+    """
+    Token bucket stored in MongoDB so every API worker draws from the same quota.
+    Refill and take happen in a single atomic update using the server clock, which
+    also maintains per-minute call counters for shared utilization reporting.
+    """
+
+    _client: Optional[MongoClient] = None
+    _client_lock = threading.Lock()
+
+    def __init__(self, provider: str, requests_per_minute: int, burst: int):
+        self.provider = provider
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(burst)
+        # Used while MongoDB is unreachable so outbound calls are still paced
+        self.fallback = LocalTokenBucket(requests_per_minute, burst)
+        self._unavailable_until = 0.0
+
+    @classmethod
+    def _collection(cls):
+        with cls._client_lock:
+            if cls._client is None:
+                cls._client = MongoClient(
+                    settings.MONGO_URI,
+                    serverSelectionTimeoutMS=MONGO_TIMEOUT_MS,
+                    connectTimeoutMS=MONGO_TIMEOUT_MS,
+                    socketTimeoutMS=MONGO_TIMEOUT_MS * 2,
+                )
+        return cls._client.get_default_database(default="financial_analyzer")["rate_limits"]
+
+    def _available(self) -> bool:
+        return time.monotonic() >= self._unavailable_until
+
+    def _mark_unavailable(self, error: Exception):
+        """Switches to the local bucket for the cooldown period, logging once per outage."""
+        if self._available():
+            print(
+                f"Shared rate limiter unavailable for {self.provider}, using local bucket for "
+                f"{settings.RATE_LIMIT_FALLBACK_COOLDOWN_SECONDS}s: {error}"
+            )
+        self._unavailable_until = time.monotonic() + settings.RATE_LIMIT_FALLBACK_COOLDOWN_SECONDS
+
+    def try_acquire(self, priority: str = INTERACTIVE) -> float:
+        """Takes a token if available to this priority and returns 0, otherwise returns seconds until one is."""
+        if not self._available():
+            return self.fallback.try_acquire(priority)
+
+        # Batch callers must leave the interactive reserve in the shared bucket
+        threshold = grant_threshold(self.capacity, priority)
+        now_ms = {"$toLong": "$$NOW"}
+        window_ms = UTILIZATION_WINDOW_SECONDS * 1000
+        window_start = {"$subtract": [now_ms, {"$mod": [now_ms, window_ms]}]}
+        refilled = {"$add": [
+            {"$ifNull": ["$tokens", self.capacity]},
+            {"$multiply": [
+                {"$subtract": [now_ms, {"$ifNull": ["$refilled_at", now_ms]}]},
+                self.rate / 1000.0,
+            ]},
+        ]}
+        same_window = {"$eq": ["$window_start", window_start]}
+        previous_window = {"$eq": ["$window_start", {"$subtract": [window_start, window_ms]}]}
+
+        try:
+            bucket = self._collection().find_one_and_update(
+                {"_id": self.provider},
+                [
+                    {"$set": {"tokens": {"$min": [self.capacity, refilled]}, "refilled_at": now_ms}},
+                    {"$set": {
+                        "granted": {"$gte": ["$tokens", threshold]},
+                        "tokens": {"$cond": [{"$gte": ["$tokens", threshold]}, {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                    }},
+                    # Fixed-window call counters, rolled over when a new minute starts
+                    {"$set": {
+                        "prev_window_calls": {"$cond": [
+                            same_window,
+                            {"$ifNull": ["$prev_window_calls", 0]},
+                            {"$cond": [previous_window, {"$ifNull": ["$window_calls", 0]}, 0]},
+                        ]},
+                        "window_calls": {"$add": [
+                            {"$cond": [same_window, {"$ifNull": ["$window_calls", 0]}, 0]},
+                            {"$cond": ["$granted", 1, 0]},
+                        ]},
+                        "window_start": window_start,
+                    }},
+                ],
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except Exception as e:
+            self._mark_unavailable(e)
+            return self.fallback.try_acquire(priority)
+
+        if bucket["granted"]:
+            return 0.0
+        return (threshold - bucket["tokens"]) / self.rate
+
+    def recent_calls(self) -> Optional[int]:
+        """
+        Estimates calls across all workers over the last window by weighting the
+        previous minute's counter by how much of it still overlaps the window.
+        Returns None while MongoDB is unavailable.
+        """
+        if not self._available():
+            return None
+        try:
+            bucket = self._collection().find_one({"_id": self.provider})
+        except Exception as e:
+            self._mark_unavailable(e)
+            return None
+        if not bucket or "window_start" not in bucket:
+            return 0
+
+        window_ms = UTILIZATION_WINDOW_SECONDS * 1000
+        elapsed_ms = time.time() * 1000 - bucket["window_start"]
+        if elapsed_ms >= 2 * window_ms:
+            return 0
+        if elapsed_ms >= window_ms:
+            # Counters are from the previous window relative to now
+            return round(bucket["window_calls"] * (1 - (elapsed_ms - window_ms) / window_ms))
+        overlap = 1 - elapsed_ms / window_ms
+        return round(bucket["window_calls"] + bucket.get("prev_window_calls", 0) * overlap)
+
+class OutboundGovernor:
+    """
+    Paces calls to one provider through a token bucket that reserves capacity for
+    interactive callers, serves callers queued in this process in priority order,
+    and owns retries of throttled or transient failures with jittered exponential
+    backoff. Every attempt takes a token.
+    """
+
+    def __init__(self, provider: str, bucket, requests_per_minute: int):
+        self.provider = provider
+        self.bucket = bucket
+        self.requests_per_minute = requests_per_minute
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._granted_at = deque()
+        self._metrics = {
+            "calls": 0,
+            "throttled": 0,
+            "total_wait_ms": 0.0,
+            "rate_limit_errors": 0,
+            "transient_errors": 0,
+            "retries": 0,
+            "failures": 0,
+        }
+        self._calls_by_priority = {priority: 0 for priority in PRIORITY_RANKS}
+
+    def acquire(self, priority: str):
+        """Blocks until this caller is at the head of the queue and a token is available."""
+        ticket = (PRIORITY_RANKS.get(priority, PRIORITY_RANKS[BATCH]), next(self._sequence))
+        started_at = time.monotonic()
+        throttled = False
+
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            # Wake a throttled head so a higher-priority arrival can take its place
+            self._cond.notify_all()
+        try:
+            while True:
+                with self._cond:
+                    while self._waiters[0] != ticket:
+                        self._cond.wait()
+
+                # The bucket may do a network round trip, so it's called outside the lock
+                wait = self.bucket.try_acquire(priority)
+                if wait <= 0:
+                    break
+                throttled = True
+                with self._cond:
+                    self._cond.wait(timeout=wait)
+        finally:
+            # Leave the queue (also on interruption) and let the next caller in
+            with self._cond:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+        with self._cond:
+            now = time.monotonic()
+            self._granted_at.append(now)
+            self._metrics["calls"] += 1
+            self._calls_by_priority[priority] = self._calls_by_priority.get(priority, 0) + 1
+            self._metrics["total_wait_ms"] += (now - started_at) * 1000
+            if throttled:
+                self._metrics["throttled"] += 1
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """
+        Records a failed attempt and returns the jittered backoff before the next
+        one, or None if the error isn't retryable or retries are exhausted.
+        """
+        rate_limited = is_rate_limit_error(error)
+        if not rate_limited and not is_transient_error(error):
+            return None
+        with self._cond:
+            self._metrics["rate_limit_errors" if rate_limited else "transient_errors"] += 1
+            if attempt >= settings.OUTBOUND_MAX_RETRIES:
+                self._metrics["failures"] += 1
+                return None
+            self._metrics["retries"] += 1
+
+        delay = min(
+            settings.OUTBOUND_BACKOFF_MAX_SECONDS,
+            settings.OUTBOUND_BACKOFF_BASE_SECONDS * (2 ** attempt),
+        )
+        print(f"{self.provider} call failed with {type(error).__name__} (attempt {attempt + 1}), backing off up to {delay:.1f}s")
+        return random.uniform(0, delay)
+
+    def call(self, fn: Callable[[], Any], priority: Optional[str] = None) -> Any:
+        """Runs fn under the rate limit, retrying throttled and transient errors with full-jitter backoff."""
+        priority = priority or outbound_priority.get()
+        attempt = 0
+        while True:
+            self.acquire(priority)
+            try:
+                return fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], priority: Optional[str] = None) -> Any:
+        """Async counterpart of call; waiting for a token happens in a worker thread."""
+        priority = priority or outbound_priority.get()
+        attempt = 0
+        while True:
+            await asyncio.to_thread(self.acquire, priority)
+            try:
+                return await fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Returns throttling counters and utilization of the configured rate. Counters
+        and queue depth are per process; utilization comes from the shared bucket
+        when one is available. May block on MongoDB, so call it off the event loop.
+        """
+        with self._cond:
+            cutoff = time.monotonic() - UTILIZATION_WINDOW_SECONDS
+            while self._granted_at and self._granted_at[0] < cutoff:
+                self._granted_at.popleft()
+            process_calls = len(self._granted_at)
+            metrics = dict(self._metrics)
+            metrics["calls_by_priority"] = dict(self._calls_by_priority)
+            metrics["queued"] = len(self._waiters)
+
+        shared_calls = self.bucket.recent_calls()
+        recent_calls = process_calls if shared_calls is None else shared_calls
+
+        # Per-minute rate scaled to the utilization window
+        window_limit = self.requests_per_minute * UTILIZATION_WINDOW_SECONDS / 60
+        metrics.update({
+            "provider": self.provider,
+            "requests_per_minute": self.requests_per_minute,
+            "process_calls_last_window": process_calls,
+            "calls_last_window": recent_calls,
+            "utilization_scope": "process" if shared_calls is None else "shared",
+            "utilization": recent_calls / window_limit if window_limit else 0.0,
+            "avg_wait_ms": metrics["total_wait_ms"] / metrics["calls"] if metrics["calls"] else 0.0,
+        })
+        return metrics
+
+def _build_governor(provider: str, requests_per_minute: int, burst: int) -> OutboundGovernor:
+    """Creates a governor backed by the configured token bucket backend."""
+    if settings.RATE_LIMIT_BACKEND == "mongo":
+        bucket = MongoTokenBucket(provider, requests_per_minute, burst)
+    else:
+        bucket = LocalTokenBucket(requests_per_minute, burst)
+    return OutboundGovernor(provider, bucket, requests_per_minute)
+
+# Process-wide governors shared by every crew
+gemini_governor = _build_governor("gemini", settings.GEMINI_REQUESTS_PER_MINUTE, settings.GEMINI_BURST)
+serper_governor = _build_governor("serper", settings.SERPER_REQUESTS_PER_MINUTE, settings.SERPER_BURST)
+
+def governor_metrics() -> Dict[str, Dict[str, Any]]:
+    """Returns metrics for all outbound providers."""
+    return {governor.provider: governor.snapshot() for governor in (gemini_governor, serper_governor)}
@@ -68,4 +68,17 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserInDB:
     if user is None:
         raise credentials_exception
     
-    return UserInDB(**user)
\ No newline at end of file
+    return UserInDB(**user)
+
+# Operational metrics access dependency
+async def get_metrics_admin(current_user: UserInDB = Depends(get_current_user)) -> UserInDB:
+    """
+    Restricts process-wide metrics, which aggregate every user's analyses, to the
+    usernames listed in METRICS_ADMIN_USERS.
+    """
+    if current_user.username not in settings.METRICS_ADMIN_USERS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to view operational metrics.",
+        )
+    return current_user
\ No newline at end of file
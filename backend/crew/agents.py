@@ -1,19 +1,16 @@
+from typing import Optional
 from crewai import Agent
-from langchain_google_genai import ChatGoogleGenerativeAI
-from core.config import settings
-from .tools import PDFSearchTool, SerperSearchTool
-
-# Initialize Gemini LLM for all agents
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    verbose=True,
-    temperature=0.2,
-    google_api_key=settings.GEMINI_API_KEY
-)
+from .routing import ModelRouter, FINANCIAL_ANALYSIS, MARKET_RESEARCH, INVESTMENT_ADVISORY, RISK_ASSESSMENT
+from .tools import FinancialAnalysisTools
 
 class FinancialAnalysisAgents:
     """Collection of specialized AI agents for comprehensive financial analysis"""
     
+    def __init__(self, tools: FinancialAnalysisTools, router: Optional[ModelRouter] = None):
+        # Tools are per analysis; each agent gets its Gemini model from the router based on its stage
+        self.tools = tools
+        self.router = router or ModelRouter()
+    
     def financial_analyst(self):
         """Creates agent for detailed financial document analysis"""
         return Agent(
@@ -33,8 +30,8 @@ class FinancialAnalysisAgents:
             """,
             verbose=True,
             memory=True,
-            llm=llm,
-            tools=[PDFSearchTool],
+            llm=self.router.llm_for(FINANCIAL_ANALYSIS),
+            tools=[self.tools.pdf_search],
             allow_delegation=False
         )
 
@@ -56,8 +53,8 @@ class FinancialAnalysisAgents:
             """,
             verbose=True,
             memory=True,
-            llm=llm,
-            tools=[SerperSearchTool],
+            llm=self.router.llm_for(MARKET_RESEARCH),
+            tools=[self.tools.web_search],
             allow_delegation=False
         )
     
@@ -79,7 +76,7 @@ class FinancialAnalysisAgents:
             """,
             verbose=True,
             memory=True,
-            llm=llm,
+            llm=self.router.llm_for(INVESTMENT_ADVISORY),
             allow_delegation=False
         )
 
@@ -102,6 +99,6 @@ class FinancialAnalysisAgents:
             """,
             verbose=True,
             memory=True,
-            llm=llm,
+            llm=self.router.llm_for(RISK_ASSESSMENT),
             allow_delegation=False
         )
\ No newline at end of file
@@ -0,0 +1,402 @@
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk, LLMResult
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_google_genai.chat_models import _response_to_result
+from pydantic import BaseModel
+from pypdf import PdfReader
+from core.config import settings
+from core.rate_limiter import gemini_governor
+
+# Workflow stages, one per agent/task pair in the crew
+FINANCIAL_ANALYSIS = "financial_analysis"
+MARKET_RESEARCH = "market_research"
+INVESTMENT_ADVISORY = "investment_advisory"
+RISK_ASSESSMENT = "risk_assessment"
+STAGES = (FINANCIAL_ANALYSIS, MARKET_RESEARCH, INVESTMENT_ADVISORY, RISK_ASSESSMENT)
+
+# USD per 1M (input, output) tokens, used for per-route cost reporting
+MODEL_PRICING = {
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.00),
+}
+
+# generation_info key under which governed clients report timing and usage
+GOVERNOR_INFO_KEY = "governor"
+
+# Rough characters-per-token ratio used when the API doesn't report usage
+CHARS_PER_TOKEN = 4
+
+class RoutingRule(BaseModel):
+    """Maps a stage (and optionally a document size range) to a model tier."""
+    stage: str
+    tier: str
+    min_pages: Optional[int] = None
+    max_pages: Optional[int] = None
+
+    def matches(self, stage: str, document_pages: Optional[int]) -> bool:
+        if self.stage not in (stage, "*"):
+            return False
+        if self.min_pages is None and self.max_pages is None:
+            return True
+        # Size-bounded rules only apply when the document size is known
+        if document_pages is None:
+            return False
+        if self.min_pages is not None and document_pages < self.min_pages:
+            return False
+        if self.max_pages is not None and document_pages > self.max_pages:
+            return False
+        return True
+
+class RouteDecision(BaseModel):
+    """A recorded routing choice for one stage of an analysis."""
+    stage: str
+    tier: str
+    model: str
+    reason: str
+    document_pages: Optional[int] = None
+
+def default_rules() -> List[RoutingRule]:
+    """Default tiering: cheap models for planning and short filings, large model for synthesis."""
+    small = settings.SMALL_DOCUMENT_MAX_PAGES
+    large = settings.LARGE_DOCUMENT_MIN_PAGES
+    return [
+        RoutingRule(stage=MARKET_RESEARCH, tier="fast"),
+        RoutingRule(stage=FINANCIAL_ANALYSIS, tier="fast", max_pages=small),
+        RoutingRule(stage=FINANCIAL_ANALYSIS, tier="advanced", min_pages=large),
+        RoutingRule(stage=INVESTMENT_ADVISORY, tier="advanced"),
+        RoutingRule(stage=RISK_ASSESSMENT, tier="advanced", min_pages=large),
+        RoutingRule(stage="*", tier="standard"),
+    ]
+
+def model_for_tier(tier: str) -> str:
+    """Resolves a tier name to a configured model, treating unknown tiers as model names."""
+    tiers = {
+        "fast": settings.LLM_MODEL_FAST,
+        "standard": settings.LLM_MODEL_STANDARD,
+        "advanced": settings.LLM_MODEL_ADVANCED,
+    }
+    return tiers.get(tier, tier)
+
+def count_document_pages(file_path: str) -> Optional[int]:
+    """Returns the page count of a PDF, or None if it can't be read."""
+    try:
+        return len(PdfReader(file_path).pages)
+    except Exception as e:
+        print(f"Could not determine page count for {file_path}: {e}")
+        return None
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+    """Estimates USD cost for a call, or None for models without known pricing."""
+    pricing = MODEL_PRICING.get(model)
+    if pricing is None:
+        return None
+    input_price, output_price = pricing
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+class RouteStats:
+    """
+    Thread-safe latency, token and cost counters keyed by (stage, model).
+    Latency covers only the successful model request; time spent queued in the
+    rate limiter, backing off and on failed attempts is tracked separately as
+    limiter wait. usage_source tells whether token and cost totals come from usage reported by
+    the API, from the character-based estimate, or from a mix of both.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[tuple, Dict[str, Any]] = {}
+
+    def record(
+        self,
+        stage: str,
+        model: str,
+        latency_ms: float,
+        input_tokens: int,
+        output_tokens: int,
+        usage_estimated: bool,
+        limiter_wait_ms: float = 0.0,
+        attempts: int = 1,
+    ):
+        cost = estimate_cost(model, input_tokens, output_tokens)
+        with self._lock:
+            route = self._routes.setdefault((stage, model), {
+                "stage": stage,
+                "model": model,
+                "calls": 0,
+                "total_latency_ms": 0.0,
+                "total_limiter_wait_ms": 0.0,
+                "attempts": 0,
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "cost_usd": 0.0 if cost is not None else None,
+                "reported_usage_calls": 0,
+                "estimated_usage_calls": 0,
+            })
+            route["calls"] += 1
+            route["total_latency_ms"] += latency_ms
+            route["total_limiter_wait_ms"] += limiter_wait_ms
+            route["attempts"] += attempts
+            route["input_tokens"] += input_tokens
+            route["output_tokens"] += output_tokens
+            if cost is not None and route["cost_usd"] is not None:
+                route["cost_usd"] += cost
+            route["estimated_usage_calls" if usage_estimated else "reported_usage_calls"] += 1
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Returns a copy of every route's counters with average latency and usage source filled in."""
+        with self._lock:
+            routes = [dict(route) for route in self._routes.values()]
+        for route in routes:
+            route["avg_latency_ms"] = route["total_latency_ms"] / route["calls"] if route["calls"] else 0.0
+            route["avg_limiter_wait_ms"] = route["total_limiter_wait_ms"] / route["calls"] if route["calls"] else 0.0
+            if not route["estimated_usage_calls"]:
+                route["usage_source"] = "reported"
+            elif not route["reported_usage_calls"]:
+                route["usage_source"] = "estimated"
+            else:
+                route["usage_source"] = "mixed"
+        return routes
+
+# Process-wide aggregate across all analyses, exposed by the metrics endpoint
+global_route_stats = RouteStats()
+
+class RouteMetricsHandler(BaseCallbackHandler):
+    """LangChain callback that times each LLM call and attributes it to a route."""
+
+    def __init__(self, stage: str, model: str, stats: List[RouteStats]):
+        self.stage = stage
+        self.model = model
+        self.stats = stats
+        self._pending: Dict[UUID, tuple] = {}
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any):
+        prompt_chars = sum(len(prompt) for prompt in prompts)
+        self._pending[run_id] = (time.perf_counter(), prompt_chars)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        started_at, prompt_chars = self._pending.pop(run_id, (time.perf_counter(), 0))
+
+        # Governed clients report timing and usage on the generation; streamed calls
+        # arrive here as a single merged chunk without llm_output
+        generation = response.generations[0][0] if response.generations and response.generations[0] else None
+        info = ((generation.generation_info if generation else None) or {}).get(GOVERNOR_INFO_KEY) or {}
+
+        # Model latency is measured separately from rate-limiter waits when available
+        if "model_latency_ms" in info:
+            latency_ms = info["model_latency_ms"]
+            limiter_wait_ms = info.get("limiter_wait_ms", 0.0)
+            attempts = info.get("attempts", 1)
+        else:
+            latency_ms = (time.perf_counter() - started_at) * 1000
+            limiter_wait_ms, attempts = 0.0, 1
+
+        # Prefer usage reported by the API, falling back to a character-based estimate
+        usage = info.get("token_usage") or {}
+        usage_estimated = "prompt_tokens" not in usage or "completion_tokens" not in usage
+        if usage_estimated:
+            output_chars = sum(len(gen.text) for gens in response.generations for gen in gens)
+            input_tokens = prompt_chars // CHARS_PER_TOKEN
+            output_tokens = output_chars // CHARS_PER_TOKEN
+        else:
+            input_tokens = usage["prompt_tokens"]
+            output_tokens = usage["completion_tokens"]
+
+        for stats in self.stats:
+            stats.record(
+                self.stage, self.model, latency_ms, input_tokens, output_tokens,
+                usage_estimated, limiter_wait_ms, attempts,
+            )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._pending.pop(run_id, None)
+
+class GovernedChatGoogleGenerativeAI(ChatGoogleGenerativeAI):
+    """
+    Gemini chat model whose requests are paced by the shared outbound governor.
+    The client's own tenacity retry is bypassed on every path (invoke, stream and
+    their async variants; CrewAI streams by default) so the governor owns retries
+    and every attempt takes a token from the bucket. Timing and any usage the API
+    reports are attached to the final generation's generation_info under
+    GOVERNOR_INFO_KEY for RouteMetricsHandler.
+    """
+
+    def _governed_send(self, send: Callable[[], Any]):
+        """Sends one request through the governor, noting when each attempt started."""
+        attempt_starts = []
+
+        def attempt():
+            attempt_starts.append(time.perf_counter())
+            return send()
+
+        started_at = time.perf_counter()
+        return gemini_governor.call(attempt), started_at, attempt_starts
+
+    async def _agoverned_send(self, send: Callable[[], Awaitable[Any]]):
+        """Async counterpart of _governed_send."""
+        attempt_starts = []
+
+        async def attempt():
+            attempt_starts.append(time.perf_counter())
+            return await send()
+
+        started_at = time.perf_counter()
+        return await gemini_governor.acall(attempt), started_at, attempt_starts
+
+    @staticmethod
+    def _governor_info(raw_response, started_at: float, attempt_starts: List[float]) -> Dict[str, Any]:
+        """
+        Splits the call into model latency (successful attempt until the response
+        was fully read) and limiter wait (queueing, backoff and failed attempts).
+        """
+        finished_at = time.perf_counter()
+        info = {
+            "model_latency_ms": (finished_at - attempt_starts[-1]) * 1000,
+            "limiter_wait_ms": (attempt_starts[-1] - started_at) * 1000,
+            "attempts": len(attempt_starts),
+        }
+        # Newer SDKs report usage on the response; older ones leave it to the estimate
+        usage = getattr(raw_response, "usage_metadata", None)
+        if usage is not None:
+            info["token_usage"] = {
+                "prompt_tokens": usage.prompt_token_count,
+                "completion_tokens": usage.candidates_token_count,
+            }
+        return {GOVERNOR_INFO_KEY: info}
+
+    @staticmethod
+    def _with_info(generation, info: Dict[str, Any]):
+        generation.generation_info = {**(generation.generation_info or {}), **info}
+        return generation
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        params, chat, message = self._prepare_chat(messages, stop=stop, **kwargs)
+        response, started_at, attempt_starts = self._governed_send(
+            lambda: chat.send_message(content=message, **params)
+        )
+        result = _response_to_result(response)
+        self._with_info(result.generations[0], self._governor_info(response, started_at, attempt_starts))
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        params, chat, message = self._prepare_chat(messages, stop=stop, **kwargs)
+        response, started_at, attempt_starts = await self._agoverned_send(
+            lambda: chat.send_message_async(content=message, **params)
+        )
+        result = _response_to_result(response)
+        self._with_info(result.generations[0], self._governor_info(response, started_at, attempt_starts))
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        params, chat, message = self._prepare_chat(messages, stop=stop, **kwargs)
+        # The SDK reads the first chunk eagerly, so throttling surfaces inside the governed send
+        response, started_at, attempt_starts = self._governed_send(
+            lambda: chat.send_message(content=message, **params, stream=True)
+        )
+
+        # Hold back one chunk so the timing info can go on the last one
+        pending, raw = None, None
+        for raw in response:
+            if pending is not None:
+                if run_manager:
+                    run_manager.on_llm_new_token(pending.text)
+                yield pending
+            pending = _response_to_result(raw, stream=True).generations[0]
+
+        if pending is None:
+            pending = ChatGenerationChunk(message=AIMessageChunk(content=""))
+        self._with_info(pending, self._governor_info(raw, started_at, attempt_starts))
+        if run_manager:
+            run_manager.on_llm_new_token(pending.text)
+        yield pending
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        params, chat, message = self._prepare_chat(messages, stop=stop, **kwargs)
+        response, started_at, attempt_starts = await self._agoverned_send(
+            lambda: chat.send_message_async(content=message, **params, stream=True)
+        )
+
+        pending, raw = None, None
+        async for raw in response:
+            if pending is not None:
+                if run_manager:
+                    await run_manager.on_llm_new_token(pending.text)
+                yield pending
+            pending = _response_to_result(raw, stream=True).generations[0]
+
+        if pending is None:
+            pending = ChatGenerationChunk(message=AIMessageChunk(content=""))
+        self._with_info(pending, self._governor_info(raw, started_at, attempt_starts))
+        if run_manager:
+            await run_manager.on_llm_new_token(pending.text)
+        yield pending
+
+class ModelRouter:
+    """
+    Chooses a Gemini model per workflow stage based on configurable rules and
+    document size, and records each decision along with its latency and cost.
+    """
+
+    def __init__(self, document_pages: Optional[int] = None, rules: Optional[List[RoutingRule]] = None):
+        self.document_pages = document_pages
+        self.rules = rules if rules is not None else default_rules()
+        self.decisions: List[RouteDecision] = []
+        self.stats = RouteStats()
+
+    def decide(self, stage: str) -> RouteDecision:
+        """Picks the model for a stage; explicit overrides win over rules."""
+        override = settings.MODEL_ROUTING_OVERRIDES.get(stage)
+        if override:
+            tier, reason = override, "configured override"
+        else:
+            tier, reason = "standard", "default"
+            for rule in self.rules:
+                if rule.matches(stage, self.document_pages):
+                    tier = rule.tier
+                    reason = f"rule stage={rule.stage} pages=[{rule.min_pages}, {rule.max_pages}]"
+                    break
+
+        decision = RouteDecision(
+            stage=stage,
+            tier=tier,
+            model=model_for_tier(tier),
+            reason=reason,
+            document_pages=self.document_pages,
+        )
+        self.decisions.append(decision)
+        print(f"Routing {stage} to {decision.model} ({decision.reason})")
+        return decision
+
+    def llm_for(self, stage: str) -> ChatGoogleGenerativeAI:
+        """Builds the rate-limited LLM client for a stage, instrumented for per-route metrics."""
+        decision = self.decide(stage)
+        return GovernedChatGoogleGenerativeAI(
+            model=decision.model,
+            verbose=True,
+            temperature=0.2,
+            google_api_key=settings.GEMINI_API_KEY,
+            callbacks=[RouteMetricsHandler(stage, decision.model, [self.stats, global_route_stats])],
+        )
+
+    def report(self) -> List[Dict[str, Any]]:
+        """Returns each routing decision merged with the metrics observed for its route."""
+        metrics = {(route["stage"], route["model"]): route for route in self.stats.snapshot()}
+        report = []
+        for decision in self.decisions:
+            entry = decision.dict()
+            route = metrics.get((decision.stage, decision.model), {})
+            for key in (
+                "calls", "attempts", "total_latency_ms", "avg_latency_ms", "total_limiter_wait_ms",
+                "avg_limiter_wait_ms", "input_tokens", "output_tokens", "cost_usd",
+            ):
+                entry[key] = route.get(key, 0)
+            entry["usage_source"] = route.get("usage_source")
+            report.append(entry)
+        return report
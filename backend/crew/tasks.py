@@ -1,9 +1,13 @@
 from crewai import Task
-from .tools import PDFSearchTool, SerperSearchTool
+from .tools import FinancialAnalysisTools
 
 class FinancialAnalysisTasks:
     """Task definitions for the financial analysis workflow"""
     
+    def __init__(self, tools: FinancialAnalysisTools):
+        # Per-analysis tool instances shared with the agents of the same crew
+        self.tools = tools
+    
     def financial_analysis(self, agent, file_path, query):
         """Creates task for analyzing financial documents using PDF search"""
         return Task(
@@ -30,7 +34,7 @@ class FinancialAnalysisTasks:
                 5. **Cash Flow Analysis:** A summary of cash from operating, investing, and financing activities.
             """,
             agent=agent,
-            tools=[PDFSearchTool]
+            tools=[self.tools.pdf_search]
         )
 
     def market_research(self, agent, query):
@@ -55,7 +59,7 @@ class FinancialAnalysisTasks:
                    that could influence the company's performance.
             """,
             agent=agent,
-            tools=[SerperSearchTool],
+            tools=[self.tools.web_search],
             context=[]  # Depends on financial_analysis task output
         )
 
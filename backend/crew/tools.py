@@ -1,9 +1,50 @@
+from typing import Optional
 from crewai_tools import SerperDevTool, PDFSearchTool
 from core.config import settings
+from core.rate_limiter import RateLimitError, serper_governor
 
-# Initialize web search tool with API authentication
-SerperSearchTool = SerperDevTool(api_key=settings.SERPER_API_KEY)
+class GovernedSerperDevTool(SerperDevTool):
+    """Serper search tool whose requests are paced by the shared outbound governor."""
 
-# Initialize PDF search tool (no API key required)
-# File path will be provided during task execution
-PDFSearchTool = PDFSearchTool()
\ No newline at end of file
+    def _run(self, **kwargs):
+        run = super()._run
+
+        def search():
+            # SerperDevTool returns the raw error payload instead of raising on HTTP errors
+            results = run(**kwargs)
+            if isinstance(results, dict) and (
+                results.get("statusCode") == 429 or "too many requests" in str(results.get("message", "")).lower()
+            ):
+                raise RateLimitError(f"Serper rate limit: {results.get('message')}")
+            return results
+
+        return serper_governor.call(search)
+
+class FinancialAnalysisTools:
+    """
+    Tool instances for a single analysis. Crews run concurrently in worker threads,
+    and PDFSearchTool is a stateful RAG tool that accumulates every PDF added to it,
+    so each crew gets its own PDF tool bound to its document and stored in its own
+    vector collection; otherwise one user's analysis could search another's filing.
+    """
+
+    def __init__(self, file_path: str, collection_name: Optional[str] = None):
+        self.collection_name = collection_name
+        config = None
+        if collection_name:
+            config = {"vectordb": {"provider": "chroma", "config": {"collection_name": collection_name}}}
+        
+        # PDF search tool bound to this analysis' document (no API key required)
+        self.pdf_search = PDFSearchTool(pdf=file_path, config=config)
+        
+        # Rate-limited web search tool with API authentication
+        self.web_search = GovernedSerperDevTool(api_key=settings.SERPER_API_KEY)
+
+    def cleanup(self):
+        """Drops this analysis' vector collection once the crew has finished."""
+        if not self.collection_name:
+            return
+        try:
+            self.pdf_search.adapter.embedchain_app.db.client.delete_collection(self.collection_name)
+        except Exception as e:
+            print(f"Error removing vector collection {self.collection_name}: {e}")
\ No newline at end of file
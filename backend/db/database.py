@@ -1,4 +1,5 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING
 from core.config import settings
 
 # Global MongoDB client instance
@@ -23,4 +24,13 @@ async def get_database():
         await connect_to_mongo()
     
     # Use default database name from URI or fallback to 'financial_analyzer'
-    return client.get_default_database(default="financial_analyzer")
\ No newline at end of file
+    return client.get_default_database(default="financial_analyzer")
+
+async def ensure_indexes():
+    """Creates indexes backing the (updated_at, _id) ordered export cursors."""
+    db = await get_database()
+    analysis_requests = db["analysis_requests"]
+    await analysis_requests.create_index([("updated_at", ASCENDING), ("_id", ASCENDING)])
+    await analysis_requests.create_index(
+        [("user_id", ASCENDING), ("updated_at", ASCENDING), ("_id", ASCENDING)]
+    )
\ No newline at end of file
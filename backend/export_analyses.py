@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import os
+import sys
+from contextlib import redirect_stdout
+from datetime import datetime
+from services.export_service import (
+    DEFAULT_BATCH_SIZE, parse_fields, to_naive_utc, export_upper_bound, open_export_cursor, stream_ndjson, gzip_stream
+)
+from db.database import get_database, close_mongo_connection
+
+def positive_int(value: str) -> int:
+    """Argparse type for options that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+def parse_args():
+    """Parses command-line options for the bulk export."""
+    parser = argparse.ArgumentParser(
+        description="Stream analysis requests from MongoDB as NDJSON for downstream warehouse loads."
+    )
+    parser.add_argument("-o", "--output", default="-", help="Output file path, or '-' for stdout.")
+    parser.add_argument("--gzip", action="store_true", help="Gzip-compress the NDJSON output.")
+    parser.add_argument("--fields", default=None, help="Comma-separated list of fields to export.")
+    parser.add_argument("--user", default=None, help="Restrict the export to a single user.")
+    parser.add_argument("--status", default="completed", help="Status to export, or 'all' for every status.")
+    parser.add_argument("--since", type=datetime.fromisoformat, default=None,
+                        help="Export records updated after this ISO-8601 watermark.")
+    parser.add_argument("--until", type=datetime.fromisoformat, default=None,
+                        help="Export records updated at or before this ISO-8601 timestamp (capped at now minus the safety lag).")
+    parser.add_argument("--watermark-file", default=None,
+                        help="File holding the export watermark; read as --since and advanced to the run's upper bound on success.")
+    parser.add_argument("--batch-size", type=positive_int, default=DEFAULT_BATCH_SIZE, help="Cursor batch size.")
+    return parser.parse_args()
+
+def read_watermark(path: str):
+    """Returns the watermark stored in path, or None if it doesn't exist yet."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        value = f.read().strip()
+    return datetime.fromisoformat(value) if value else None
+
+def write_watermark(path: str, watermark: datetime):
+    """Atomically replaces the watermark file contents."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(watermark.isoformat())
+    os.replace(tmp_path, path)
+
+async def run_export(args, stdout) -> int:
+    """Runs the export and returns the number of records written."""
+    try:
+        fields = parse_fields(args.fields)
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+    since = to_naive_utc(args.since)
+    if since is None and args.watermark_file:
+        since = to_naive_utc(read_watermark(args.watermark_file))
+    until = export_upper_bound(args.until)
+
+    db = await get_database()
+    cursor = open_export_cursor(
+        db,
+        fields,
+        user_id=args.user,
+        status=None if args.status == "all" else args.status,
+        since=since,
+        until=until,
+        batch_size=args.batch_size,
+    )
+
+    # Count exported documents while passing them through untouched
+    state = {"count": 0}
+
+    async def tracked(source):
+        async for document in source:
+            state["count"] += 1
+            yield document
+
+    body = stream_ndjson(tracked(cursor))
+    if args.gzip:
+        body = gzip_stream(body)
+
+    output = stdout if args.output == "-" else open(args.output, "wb")
+    try:
+        async for chunk in body:
+            output.write(chunk)
+        output.flush()
+    finally:
+        if output is not stdout:
+            output.close()
+
+    # The whole window up to the capped bound has been covered, so it becomes the
+    # next watermark even when no records were exported. Never move it backwards
+    # (e.g. when --until or the lag cap is earlier than since), and only advance it
+    # once the output has been fully written
+    watermark = until if since is None else max(since, until)
+    if args.watermark_file:
+        write_watermark(args.watermark_file, watermark)
+
+    print(
+        f"Exported {state['count']} analysis requests; watermark: {watermark.isoformat()}",
+        file=sys.stderr,
+    )
+    return state["count"]
+
+async def main():
+    """Entry point wrapping the export with connection cleanup."""
+    args = parse_args()
+    stdout = sys.stdout.buffer
+
+    # Keep connection status messages off stdout so piped NDJSON stays clean
+    with redirect_stdout(sys.stderr):
+        try:
+            await run_export(args, stdout)
+        finally:
+            await close_mongo_connection()
+
+if __name__ == "__main__":
+    asyncio.run(main())
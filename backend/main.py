@@ -2,7 +2,7 @@ import os
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from routers import auth, analysis
-from db.database import connect_to_mongo, close_mongo_connection
+from db.database import connect_to_mongo, close_mongo_connection, ensure_indexes
 
 # Ensure uploads directory exists for file handling
 os.makedirs("uploads", exist_ok=True)
@@ -26,8 +26,9 @@ app.add_middleware(
 # Application lifecycle events
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database connection on application startup"""
+    """Initialize database connection and indexes on application startup"""
     await connect_to_mongo()
+    await ensure_indexes()
 
 @app.on_event("shutdown")
 async def shutdown_event():
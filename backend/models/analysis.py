@@ -1,7 +1,7 @@
 from pydantic import BaseModel, Field
 from pydantic.json_schema import JsonSchemaValue
 from pydantic_core import core_schema
-from typing import Optional, Any
+from typing import Optional, Any, List, Dict
 from datetime import datetime
 from bson import ObjectId
 
@@ -45,6 +45,8 @@ class AnalysisRequest(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     result: Optional[str] = None
+    # Per-stage model routing decisions with observed latency and cost
+    model_routes: Optional[List[Dict[str, Any]]] = None
 
     class Config:
         # Enable field aliasing for MongoDB compatibility
@@ -1,22 +1,58 @@
+import asyncio
 import os
 import shutil
 import uuid
-from fastapi import APIRouter, File, UploadFile, Form, Depends, HTTPException, BackgroundTasks
-from core.security import get_current_user
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, File, UploadFile, Form, Depends, HTTPException, BackgroundTasks, Query
+from fastapi.responses import StreamingResponse
+from core.security import get_current_user, get_metrics_admin
 from models.user import UserInDB
 from models.analysis import AnalysisRequest
 from services.crew_service import run_analysis_crew
+from crew.routing import global_route_stats
+from core.rate_limiter import INTERACTIVE, BATCH, governor_metrics
+from services.export_service import (
+    DEFAULT_BATCH_SIZE, parse_fields, to_naive_utc, export_upper_bound, open_export_cursor, stream_ndjson, gzip_stream
+)
 from db.database import get_database
 from bson import ObjectId
 
 router = APIRouter()
 UPLOAD_DIRECTORY = "uploads"
 
+DEFAULT_QUERY = "Provide a comprehensive analysis of this financial document, including investment recommendations and a risk assessment."
+
+async def save_upload(file: UploadFile, query: str, current_user: UserInDB, db):
+    """
+    Saves an uploaded PDF to disk and creates its analysis request in the DB.
+    Returns the new request ID and the saved file path.
+    """
+    # Generate secure filename to prevent path traversal attacks
+    safe_filename = f"{uuid.uuid4()}_{os.path.basename(file.filename)}"
+    file_path = os.path.join(UPLOAD_DIRECTORY, safe_filename)
+    
+    # Save uploaded file to disk
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+    
+    # Create database record for analysis tracking
+    analysis_request = AnalysisRequest(
+        user_id=current_user.username,
+        filename=file.filename,
+        file_path=file_path,
+        query=query
+    )
+    
+    # Insert analysis request into database
+    result = await db["analysis_requests"].insert_one(analysis_request.dict(by_alias=True))
+    return result.inserted_id, file_path
+
 @router.post("/upload")
 async def analyze_document(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    query: str = Form("Provide a comprehensive analysis of this financial document, including investment recommendations and a risk assessment."),
+    query: str = Form(DEFAULT_QUERY),
     current_user: UserInDB = Depends(get_current_user),
     db = Depends(get_database)
 ):
@@ -29,28 +65,10 @@ async def analyze_document(
         raise HTTPException(status_code=400, detail="Invalid file type. Only PDFs are accepted.")
     
     try:
-        # Generate secure filename to prevent path traversal attacks
-        safe_filename = f"{uuid.uuid4()}_{os.path.basename(file.filename)}"
-        file_path = os.path.join(UPLOAD_DIRECTORY, safe_filename)
-        
-        # Save uploaded file to disk
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Create database record for analysis tracking
-        analysis_request = AnalysisRequest(
-            user_id=current_user.username,
-            filename=file.filename,
-            file_path=file_path,
-            query=query
-        )
+        request_id, file_path = await save_upload(file, query, current_user, db)
         
-        # Insert analysis request into database
-        result = await db["analysis_requests"].insert_one(analysis_request.dict(by_alias=True))
-        request_id = result.inserted_id
-        
-        # Queue background analysis task
-        background_tasks.add_task(run_analysis_crew, request_id, file_path, query)
+        # Queue background analysis task ahead of batch work for outbound calls
+        background_tasks.add_task(run_analysis_crew, request_id, file_path, query, INTERACTIVE)
         
         return {
             "status": "success",
@@ -62,6 +80,40 @@ async def analyze_document(
         print(f"Error during file upload: {e}")
         raise HTTPException(status_code=500, detail="An error occurred during file processing.")
 
+@router.post("/upload/batch")
+async def analyze_documents_batch(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    query: str = Form(DEFAULT_QUERY),
+    current_user: UserInDB = Depends(get_current_user),
+    db = Depends(get_database)
+):
+    """
+    Handles a multi-document upload. Analyses run one after another at batch
+    priority, so their Gemini and Serper calls leave a reserved share of the
+    shared quotas to interactive uploads on every worker.
+    """
+    # Validate every file before saving any of them
+    if any(file.content_type != "application/pdf" for file in files):
+        raise HTTPException(status_code=400, detail="Invalid file type. Only PDFs are accepted.")
+    
+    try:
+        request_ids = []
+        for file in files:
+            request_id, file_path = await save_upload(file, query, current_user, db)
+            background_tasks.add_task(run_analysis_crew, request_id, file_path, query, BATCH)
+            request_ids.append(str(request_id))
+        
+        return {
+            "status": "success",
+            "message": f"{len(request_ids)} files uploaded successfully. Batch analysis is in progress.",
+            "request_ids": request_ids
+        }
+        
+    except Exception as e:
+        print(f"Error during batch upload: {e}")
+        raise HTTPException(status_code=500, detail="An error occurred during file processing.")
+
 @router.get("/status/{request_id}")
 async def get_analysis_status(
     request_id: str, 
@@ -93,6 +145,7 @@ async def get_analysis_status(
         "filename": analysis_doc.get("filename"),
         "query": analysis_doc.get("query"),
         "created_at": analysis_doc.get("created_at"),
+        "model_routes": analysis_doc.get("model_routes"),
     }
 
 @router.get("/history")
@@ -112,4 +165,64 @@ async def get_user_history(
         document["_id"] = str(document["_id"])
         history.append(document)
     
-    return history
\ No newline at end of file
+    return history
+
+@router.get("/routing/metrics")
+async def get_routing_metrics(current_user: UserInDB = Depends(get_metrics_admin)):
+    """
+    Returns aggregate latency, token and cost figures per (stage, model) route
+    observed by this process since startup, across all users' analyses; only
+    available to METRICS_ADMIN_USERS. Each route's usage_source marks
+    whether token and cost figures are reported by the API or estimated.
+    """
+    return {"routes": global_route_stats.snapshot()}
+
+@router.get("/outbound/metrics")
+async def get_outbound_metrics(current_user: UserInDB = Depends(get_metrics_admin)):
+    """
+    Returns utilization and throttling figures for the Gemini and Serper rate limiters,
+    covering all users' jobs; only available to METRICS_ADMIN_USERS.
+    """
+    # Shared-bucket utilization is read from MongoDB synchronously, so keep it off the event loop
+    return {"providers": await asyncio.to_thread(governor_metrics)}
+
+@router.get("/export")
+async def export_analyses(
+    export_format: str = Query("ndjson", alias="format", pattern=r"^(ndjson|ndjson\.gz)$"),
+    fields: Optional[str] = Query(None, description="Comma-separated list of fields to include."),
+    since: Optional[datetime] = Query(None, description="Only export records updated after this watermark."),
+    until: Optional[datetime] = Query(None, description="Only export records updated at or before this time (capped at now minus the safety lag)."),
+    status: Optional[str] = Query("completed", description="Status to export, or 'all' for every status."),
+    batch_size: int = Query(DEFAULT_BATCH_SIZE, ge=1, le=10000),
+    current_user: UserInDB = Depends(get_current_user),
+    db = Depends(get_database)
+):
+    """
+    Streams the current user's analysis requests as NDJSON (optionally gzip-compressed),
+    ordered by updated_at. The X-Export-Watermark header holds the window's upper
+    bound, to be passed as `since` on the next incremental export.
+    """
+    # Validate requested field selection
+    try:
+        selected_fields = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    upper_bound = export_upper_bound(until)
+    cursor = open_export_cursor(
+        db,
+        selected_fields,
+        user_id=current_user.username,
+        status=None if status == "all" else status,
+        since=to_naive_utc(since),
+        until=upper_bound,
+        batch_size=batch_size,
+    )
+    body = stream_ndjson(cursor)
+    headers = {"X-Export-Watermark": upper_bound.isoformat()}
+
+    if export_format == "ndjson.gz":
+        headers["Content-Disposition"] = 'attachment; filename="analysis_export.ndjson.gz"'
+        return StreamingResponse(gzip_stream(body), media_type="application/gzip", headers=headers)
+
+    return StreamingResponse(body, media_type="application/x-ndjson", headers=headers)
\ No newline at end of file
@@ -1,17 +1,25 @@
+import asyncio
 import os
 from datetime import datetime
 from crewai import Crew, Process
 from crew.agents import FinancialAnalysisAgents
+from crew.routing import ModelRouter, count_document_pages
+from core.rate_limiter import INTERACTIVE, outbound_priority
 from crew.tasks import FinancialAnalysisTasks
+from crew.tools import FinancialAnalysisTools
 from db.database import get_database
 from bson import ObjectId
 
-async def run_analysis_crew(request_id: ObjectId, file_path: str, query: str):
+async def run_analysis_crew(request_id: ObjectId, file_path: str, query: str, priority: str = INTERACTIVE):
     """
     Runs the financial analysis crew and updates the database with the result.
-    This function is designed to be run in the background.
+    This function is designed to be run in the background. Batch-priority jobs
+    can't use the share of the Gemini and Serper quotas reserved for interactive
+    jobs on any worker, and queue behind them within this process.
     """
     db = await get_database()
+    router = ModelRouter(document_pages=count_document_pages(file_path))
+    tools = None
     
     try:
         # Mark analysis as in progress
@@ -20,9 +28,12 @@ async def run_analysis_crew(request_id: ObjectId, file_path: str, query: str):
             {"$set": {"status": "in_progress", "updated_at": datetime.utcnow()}}
         )
         
+        # Build this analysis' own tools; indexing the PDF is blocking, so keep it off the event loop
+        tools = await asyncio.to_thread(FinancialAnalysisTools, file_path, f"analysis_{request_id}")
+        
         # Initialize AI agents and task definitions
-        agents = FinancialAnalysisAgents()
-        tasks = FinancialAnalysisTasks()
+        agents = FinancialAnalysisAgents(tools, router)
+        tasks = FinancialAnalysisTasks(tools)
         
         # Create specialized agents for different analysis aspects
         financial_analyst = agents.financial_analyst()
@@ -44,13 +55,20 @@ async def run_analysis_crew(request_id: ObjectId, file_path: str, query: str):
             verbose=2
         )
         
-        # Execute the analysis workflow
-        result = financial_crew.kickoff()
+        # Execute the analysis workflow in a worker thread so rate-limit waits don't block the event loop;
+        # the thread inherits the job priority from the context
+        outbound_priority.set(priority)
+        result = await asyncio.to_thread(financial_crew.kickoff)
         
         # Save successful completion to database
         await db["analysis_requests"].update_one(
             {"_id": request_id},
-            {"$set": {"status": "completed", "result": result, "updated_at": datetime.utcnow()}}
+            {"$set": {
+                "status": "completed",
+                "result": result,
+                "model_routes": router.report(),
+                "updated_at": datetime.utcnow()
+            }}
         )
         
     except Exception as e:
@@ -59,10 +77,19 @@ async def run_analysis_crew(request_id: ObjectId, file_path: str, query: str):
         # Record failure in database
         await db["analysis_requests"].update_one(
             {"_id": request_id},
-            {"$set": {"status": "failed", "result": str(e), "updated_at": datetime.utcnow()}}
+            {"$set": {
+                "status": "failed",
+                "result": str(e),
+                "model_routes": router.report(),
+                "updated_at": datetime.utcnow()
+            }}
         )
         
     finally:
+        # Drop the per-analysis vector collection
+        if tools is not None:
+            await asyncio.to_thread(tools.cleanup)
+        
         # Clean up uploaded file to prevent disk space issues
         if os.path.exists(file_path):
             try:
@@ -0,0 +1,139 @@
+import json
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Iterable, List, Optional
+from bson import ObjectId
+from pymongo import ASCENDING, ReadPreference
+from core.config import settings
+
+# Fields that may be selected for export from the analysis_requests collection
+EXPORTABLE_FIELDS = (
+    "_id", "user_id", "filename", "file_path", "query",
+    "status", "created_at", "updated_at", "result", "model_routes",
+)
+DEFAULT_EXPORT_FIELDS = (
+    "_id", "user_id", "filename", "query", "status", "created_at", "updated_at", "result",
+)
+
+# Documents fetched per round trip; also the unit of work between yields
+DEFAULT_BATCH_SIZE = 500
+
+# Number of NDJSON lines buffered before a chunk is handed to the response
+LINES_PER_CHUNK = 100
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    """
+    Parses a comma-separated field list and validates it against EXPORTABLE_FIELDS.
+    Raises ValueError for unknown fields.
+    """
+    if not fields:
+        return list(DEFAULT_EXPORT_FIELDS)
+
+    selected = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in selected if name not in EXPORTABLE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown export fields: {', '.join(unknown)}")
+
+    # updated_at is always included so consumers can order and dedupe by it
+    if "updated_at" not in selected:
+        selected.append("updated_at")
+    return selected
+
+def _json_default(value):
+    """Serializes BSON and datetime values that json.dumps can't handle natively."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def to_ndjson_line(document: dict) -> bytes:
+    """Encodes a single document as one NDJSON line."""
+    return (json.dumps(document, default=_json_default, separators=(",", ":")) + "\n").encode("utf-8")
+
+def to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """
+    Normalizes a timestamp to the naive UTC form stored in updated_at. Naive
+    inputs are assumed to already be UTC; aware ones are converted.
+    """
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def export_upper_bound(until: Optional[datetime] = None) -> datetime:
+    """
+    Caps the export window at now minus EXPORT_SAFETY_LAG_SECONDS. updated_at is
+    stamped by the writer before its update commits and replicates, so newer rows
+    may still be in flight; the capped bound is what callers should store as the
+    next watermark rather than the last exported updated_at.
+    """
+    cap = datetime.utcnow() - timedelta(seconds=settings.EXPORT_SAFETY_LAG_SECONDS)
+    return cap if until is None else min(to_naive_utc(until), cap)
+
+def open_export_cursor(
+    db,
+    fields: Iterable[str],
+    user_id: Optional[str] = None,
+    status: Optional[str] = "completed",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+):
+    """
+    Opens a batched server-side cursor over analysis_requests ordered by the
+    (updated_at, _id) watermark. Reads prefer a secondary so bulk exports stay
+    off the primary that serves interactive traffic.
+    """
+    query = {}
+    if user_id is not None:
+        query["user_id"] = user_id
+    if status is not None:
+        query["status"] = status
+
+    # Strictly-after lower bound so the previous run's watermark isn't re-exported
+    updated_range = {}
+    if since is not None:
+        updated_range["$gt"] = since
+    if until is not None:
+        updated_range["$lte"] = until
+    if updated_range:
+        query["updated_at"] = updated_range
+
+    projection = {name: 1 for name in fields}
+    if "_id" not in projection:
+        projection["_id"] = 0
+
+    collection = db["analysis_requests"].with_options(
+        read_preference=ReadPreference.SECONDARY_PREFERRED
+    )
+    return collection.find(
+        query,
+        projection=projection,
+        sort=[("updated_at", ASCENDING), ("_id", ASCENDING)],
+        batch_size=batch_size,
+    )
+
+async def stream_ndjson(cursor, lines_per_chunk: int = LINES_PER_CHUNK) -> AsyncIterator[bytes]:
+    """
+    Yields NDJSON chunks from a cursor. Only one chunk is held in memory at a
+    time, so memory use is independent of the number of exported documents.
+    """
+    buffer = []
+    async for document in cursor:
+        buffer.append(to_ndjson_line(document))
+        if len(buffer) >= lines_per_chunk:
+            yield b"".join(buffer)
+            buffer = []
+
+    if buffer:
+        yield b"".join(buffer)
+
+async def gzip_stream(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """Compresses a byte stream incrementally into a single gzip member."""
+    # wbits=31 selects the gzip container instead of a raw zlib stream
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
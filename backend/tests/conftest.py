@@ -0,0 +1,13 @@
+import os
+import sys
+
+# Make backend packages importable and provide the settings required at import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GEMINI_API_KEY", "test-gemini-key")
+os.environ.setdefault("SERPER_API_KEY", "test-serper-key")
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017/financial_analyzer_test")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ["RATE_LIMIT_BACKEND"] = "memory"
+os.environ["OUTBOUND_BACKOFF_BASE_SECONDS"] = "0.01"
+os.environ["OUTBOUND_BACKOFF_MAX_SECONDS"] = "0.01"
@@ -0,0 +1,98 @@
+import google.ai.generativelanguage as glm
+import pytest
+from google.api_core.exceptions import ResourceExhausted
+from langchain_core.prompts import ChatPromptTemplate
+from core.config import settings
+from core.rate_limiter import BATCH, INTERACTIVE, LocalTokenBucket, gemini_governor
+from crew.routing import MARKET_RESEARCH, GovernedChatGoogleGenerativeAI, RouteMetricsHandler, RouteStats
+
+def _response(text: str) -> glm.GenerateContentResponse:
+    return glm.GenerateContentResponse(candidates=[
+        glm.Candidate(content=glm.Content(parts=[glm.Part(text=text)], role="model"))
+    ])
+
+class FakeChatSession:
+    """Stands in for genai.ChatSession; the first request is throttled."""
+
+    def __init__(self):
+        self.requests = []
+
+    def send_message(self, content, stream=False, **params):
+        self.requests.append({"content": content, "stream": stream, **params})
+        if len(self.requests) == 1:
+            raise ResourceExhausted("Quota exceeded")
+        if stream:
+            return [_response("Final "), _response("Answer")]
+        return _response("Final Answer")
+
+@pytest.fixture
+def chat(monkeypatch):
+    session = FakeChatSession()
+
+    def prepare_chat(self, messages, stop=None, **kwargs):
+        return {"generation_config": {"stop_sequences": stop}}, session, messages[-1].content
+
+    monkeypatch.setattr(GovernedChatGoogleGenerativeAI, "_prepare_chat", prepare_chat)
+    return session
+
+def _llm():
+    return GovernedChatGoogleGenerativeAI(model="gemini-2.0-flash", google_api_key="test-gemini-key")
+
+def _chain(llm):
+    # Mirrors how CrewAI drives agent LLMs: a prompt piped into llm.bind(stop=...)
+    return ChatPromptTemplate.from_template("{input}") | llm.bind(stop=["\nObservation"])
+
+def test_stream_goes_through_governor(chat):
+    calls_before = gemini_governor.snapshot()["calls"]
+
+    chunks = list(_chain(_llm()).stream({"input": "Analyze the filing"}))
+
+    assert "".join(chunk.content for chunk in chunks) == "Final Answer"
+    assert [request["stream"] for request in chat.requests] == [True, True]
+    assert chat.requests[-1]["generation_config"]["stop_sequences"] == ["\nObservation"]
+    # The throttled attempt and the retry each took a token
+    assert gemini_governor.snapshot()["calls"] - calls_before == 2
+
+def test_invoke_goes_through_governor(chat):
+    calls_before = gemini_governor.snapshot()["calls"]
+
+    message = _chain(_llm()).invoke({"input": "Analyze the filing"})
+
+    assert message.content == "Final Answer"
+    assert [request["stream"] for request in chat.requests] == [False, False]
+    assert gemini_governor.snapshot()["calls"] - calls_before == 2
+
+@pytest.mark.parametrize("method", ["stream", "invoke"])
+def test_route_metrics_separate_model_latency_from_limiter_wait(chat, method):
+    stats = RouteStats()
+    llm = GovernedChatGoogleGenerativeAI(
+        model="gemini-2.0-flash",
+        google_api_key="test-gemini-key",
+        callbacks=[RouteMetricsHandler(MARKET_RESEARCH, "gemini-2.0-flash", [stats])],
+    )
+
+    chain = _chain(llm)
+    if method == "stream":
+        list(chain.stream({"input": "Analyze the filing"}))
+    else:
+        chain.invoke({"input": "Analyze the filing"})
+
+    (route,) = stats.snapshot()
+    assert route["calls"] == 1
+    assert route["attempts"] == 2
+    assert route["total_limiter_wait_ms"] > 0
+    assert route["usage_source"] == "estimated"
+
+def test_batch_callers_leave_interactive_reserve(monkeypatch):
+    monkeypatch.setattr(settings, "INTERACTIVE_RESERVED_FRACTION", 0.5)
+    bucket = LocalTokenBucket(requests_per_minute=60, burst=4)
+
+    # Batch may draw the bucket down to the two reserved tokens, then has to wait
+    assert bucket.try_acquire(BATCH) == 0
+    assert bucket.try_acquire(BATCH) == 0
+    assert bucket.try_acquire(BATCH) > 0
+
+    # Interactive callers can still use the reserve
+    assert bucket.try_acquire(INTERACTIVE) == 0
+    assert bucket.try_acquire(INTERACTIVE) == 0
+    assert bucket.try_acquire(INTERACTIVE) > 0